@@ -1,69 +1,156 @@
 #!/usr/bin/env python
 
 from flask import Flask, request, send_file, Response
+import hashlib
 import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
+import orjson
 import tifffile as tiff
+from numba import njit
+# Pillow-SIMD (`pip install pillow-simd` in place of `pillow`) is an API-compatible
+# drop-in with AVX2 kernels for the resample/convert/encode paths used below.
 from PIL import Image
 
+try:
+    from turbojpeg import TurboJPEG, TJCS_CMYK, TJCS_YCCK, TJPF_GRAY, TJPF_RGB, TJSAMP_GRAY
+    _tj = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    # PyTurboJPEG or the libturbojpeg library itself is missing: use Pillow
+    _tj = None
+
 app = Flask(__name__)
 
+# WebP cannot store images larger than this on either side; those stay PNG
+WEBP_MAX_DIM = 16383
+
+DOWNLOAD_NAMES = {
+    "application/octet-stream": "image.rgba",
+    "image/webp": "image.webp",
+    "image/png": "image.png",
+}
+
+# Side length of the tiles served by /api/tile
+TILE_SIZE = 256
+
+# Raw RGBA responses start with a JSON header padded with spaces to this size
+RAW_HEADER_BYTES = 256
+
+# Panels of the built-in viewer; /api/upload only accepts these
+SIDES = ("tl", "tr", "bl", "br")
+
+# Encoded outputs above this size are spooled to disk instead of kept in RAM
+SPOOL_MAX_BYTES = 4 * 1024 * 1024
+
 # ---------- Python helpers (runs when you upload a file) ----------
 
-def load_tif_or_image(file_storage):
+def load_tif_or_image(data, filename):
     """
-    Read TIFF/OME-TIFF/PNG/JPEG into a numpy array using tifffile/Pillow.
-    We first read the uploaded file into memory (bytes) and wrap it in BytesIO,
-    so tifffile/Pillow always see a clean file-like object.
+    Read TIFF/OME-TIFF/PNG/JPEG bytes into a numpy array using tifffile/Pillow.
+    TIFFs are written to a temporary file and decoded by tifffile straight into
+    a numpy.memmap, so the decoded pixels live outside the Python heap (they
+    are copied into memory where the mapping would outlive this call).
+    JPEGs are decoded with PyTurboJPEG when it is available. Other images
+    are wrapped in BytesIO, so Pillow always sees a clean file-like object.
     """
-    filename = file_storage.filename or ""
+    filename = filename or ""
     name_lower = filename.lower()
 
-    data = file_storage.read()
-    bio = io.BytesIO(data)
-
     # TIFF / OME-TIFF via tifffile
     if name_lower.endswith(".tif") or name_lower.endswith(".tiff") \
        or name_lower.endswith(".ome.tif") or name_lower.endswith(".ome.tiff"):
-        arr = tiff.imread(bio)
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".tif")
+        try:
+            with tmp:
+                tmp.write(data)
+            with tiff.TiffFile(tmp.name) as tif:
+                series = tif.series[0]
+                if len(series.shape) >= 4:
+                    # OME-like (Z, C, H, W) / (T, C, Z, H, W): decode only page 0.
+                    # A page may itself hold several planes (tifffile's own writer
+                    # stores (Z, C, Y, X) as Z pages of (C, Y, X)), so index the
+                    # leading axes down to Z=0, C=0, keeping a trailing RGB axis.
+                    print(f"Treating {series.axes} {series.shape} as a stack, decoding first plane only")
+                    arr = series.asarray(key=0, out="memmap")
+                    keep_ndim = 3 if series.axes.endswith("S") else 2
+                    while arr.ndim > keep_ndim:
+                        arr = arr[0]
+                elif is_channels_first(series.shape) and series.shape[0] > 3 \
+                        and len(series.pages) == series.shape[0]:
+                    # One page per channel and only 3 get displayed: skip the rest
+                    print(f"Treating {series.axes} {series.shape} as (C,H,W), decoding first 3 channels only")
+                    arr = series.asarray(key=slice(0, 3), out="memmap")
+                else:
+                    arr = series.asarray(out="memmap")
+            # For uncompressed TIFFs the memmap maps our tempfile itself, which
+            # must not be unlinked while mapped (PermissionError on Windows).
+            # uint8 arrays are displayed as-is and end up in the cached
+            # pyramid, so copy those too rather than pinning a deleted file.
+            if isinstance(arr, np.memmap) and (
+                    arr.dtype == np.uint8 or arr.filename == os.path.abspath(tmp.name)):
+                arr = np.array(arr)
+        finally:
+            os.unlink(tmp.name)
         print(f"Loaded TIFF {filename} with shape {arr.shape}, dtype {arr.dtype}")
         return arr
 
-    # Other images via Pillow (PNG, JPEG, etc.)
+    # JPEG via libjpeg-turbo, decoded straight into a numpy array
+    if _tj is not None and name_lower.endswith((".jpg", ".jpeg")):
+        _, _, subsample, colorspace = _tj.decode_header(data)
+        if colorspace not in (TJCS_CMYK, TJCS_YCCK):
+            if subsample == TJSAMP_GRAY:
+                arr = _tj.decode(data, pixel_format=TJPF_GRAY)[..., 0]
+            else:
+                arr = _tj.decode(data, pixel_format=TJPF_RGB)
+            print(f"Loaded JPEG {filename} with shape {arr.shape}, dtype {arr.dtype}")
+            return arr
+
+    bio = io.BytesIO(data)
+
+    # Other images via Pillow (PNG, WebP, CMYK JPEG, etc.)
     img = Image.open(bio)
     arr = np.array(img)
     print(f"Loaded image {filename} with shape {arr.shape}, dtype {arr.dtype}")
     return arr
 
 
+def is_channels_first(shape):
+    # (C, H, W) heuristic: a few planes of a square image
+    return len(shape) == 3 and shape[0] <= 16 and shape[1] == shape[2]
+
+
 def select_display_array(arr):
     """
     Convert arbitrary shapes to something displayable:
       - (H, W)           -> grayscale
       - (C, H, W)        -> channels-first (pick first or RGB)
       - (H, W, C)        -> channels-last (pick first or RGB)
-      - (Z, C, H, W)     -> pick Z=0, C=0
       - (Z, H, W)        -> pick Z=0
+    (Z, C, H, W) stacks never get here: load_tif_or_image only decodes Z=0, C=0.
     """
     arr = np.asarray(arr)
 
     if arr.ndim == 2:
         return arr
 
-    # OME-like: (Z, C, H, W)
-    if arr.ndim == 4:
-        z, c, h, w = arr.shape
-        print(f"Treating as (Z,C,H,W), picking Z=0,C=0 from shape {arr.shape}")
-        return arr[0, 0]
-
-    # (C, H, W) heuristic
-    if arr.ndim == 3 and arr.shape[0] <= 16 and arr.shape[1] == arr.shape[2]:
+    # (C, H, W)
+    if is_channels_first(arr.shape):
         c = arr.shape[0]
         if c == 1:
             return arr[0]
         print(f"Treating as (C,H,W), using first 3 of C={c}")
-        return np.moveaxis(arr[:3, :, :], 0, -1)
+        # Build a contiguous (H, W, 3) with one copy per plane instead of handing
+        # a strided moveaxis view downstream, where it'd be copied anyway
+        n = min(c, 3)
+        hwc = np.empty((arr.shape[1], arr.shape[2], n), dtype=arr.dtype)
+        for i in range(n):
+            hwc[..., i] = arr[i]
+        return hwc
 
     # (H, W, C)
     if arr.ndim == 3 and arr.shape[-1] <= 16:
@@ -78,21 +165,59 @@ def select_display_array(arr):
     return np.squeeze(arr[0])
 
 
-def normalize_to_uint8(arr):
+# Deliberately not parallel=True: EXECUTOR already runs one upload per core,
+# and Numba's fallback "workqueue" threading layer aborts the process when
+# several threads launch parallel kernels at once. nogil lets those threads
+# run this loop concurrently instead.
+@njit(fastmath=True, cache=True, nogil=True)
+def _norm_u8(flat, vmin, scale, out):
+    # Single fused pass: each pixel is read once and written once as uint8.
+    # The clamp is branch-free so LLVM turns the loop into packed
+    # sub/mul, min/max, float->int convert and saturating packs (AVX2 etc.)
+    for i in range(flat.size):
+        v = (flat[i] - vmin) * scale
+        out[i] = np.uint8(min(max(v, 0.0), 255.0))
+
+
+def value_range(arr):
+    if arr.dtype.kind in "biu":
+        # Integers cannot hold NaN: use NumPy's SIMD integer min/max directly
+        return arr.min(), arr.max()
+    # NaN-skipping float reductions (what np.nanmin/np.nanmax do internally)
+    return np.fmin.reduce(arr, axis=None), np.fmax.reduce(arr, axis=None)
+
+
+def normalize_to_uint8(arr, vmin=None, vmax=None):
+    """Stretch [vmin, vmax] (default: the array's own range) to 0..255."""
     arr = np.asarray(arr)
     if arr.dtype == np.uint8:
         return arr
-    arr = arr.astype("float32")
-    vmin = np.nanmin(arr)
-    vmax = np.nanmax(arr)
+    if vmin is None or vmax is None:
+        vmin, vmax = value_range(arr)
     if vmax == vmin:
-        return np.zeros_like(arr, dtype=np.uint8)
-    arr = (arr - vmin) / (vmax - vmin)
-    arr = np.clip(arr, 0, 1)
-    return (arr * 255).astype("uint8")
-
-
-def array_to_png_bytes(arr):
+        return np.zeros(arr.shape, dtype=np.uint8)
+    vmin = float(vmin)
+    scale = 255.0 / (float(vmax) - vmin)
+    if arr.dtype.kind == "u" and arr.dtype.itemsize == 2:
+        # 65536-entry lookup table: building it costs the same for any image
+        # size, and each pixel is then a single uint16 -> uint8 gather.
+        # Indexing takes either byte order, so big-endian TIFFs need no swap.
+        lut = np.empty(65536, dtype=np.uint8)
+        _norm_u8(np.arange(65536, dtype=np.float32), vmin, scale, lut)
+        return lut[arr]
+    if not arr.dtype.isnative or arr.dtype == np.float16:
+        # Numba can't type big-endian arrays (tifffile memmaps keep the file's
+        # byte order) or float16: hand it a native array instead
+        arr = arr.astype(np.float32 if arr.dtype.kind == "f" else arr.dtype.newbyteorder("="))
+    out = np.empty(arr.shape, dtype=np.uint8)
+    _norm_u8(arr.ravel(), vmin, scale, out.ravel())
+    return out
+
+
+def to_display_image(arr):
+    """
+    Turn a display array into an 8-bit Pillow image (L, RGB or RGBA).
+    """
     arr = normalize_to_uint8(arr)
     if arr.ndim == 2:
         mode = "L"
@@ -100,17 +225,208 @@ def array_to_png_bytes(arr):
         mode = "RGB"
     elif arr.ndim == 3 and arr.shape[2] == 4:
         mode = "RGBA"
+    elif arr.ndim == 3 and arr.shape[2] == 1:
+        arr = arr[..., 0]
+        mode = "L"
     else:
         print("Unexpected shape for PNG, converting to grayscale")
-        arr = np.mean(arr, axis=-1)
-        arr = normalize_to_uint8(arr)
+        # Integer math only: arr is uint8 here, so these sums fit in uint16
+        if arr.shape[-1] >= 3:
+            # ITU-R BT.601 luma in 8-bit fixed point
+            gray = arr[..., 0].astype(np.uint16) * 77
+            gray += arr[..., 1].astype(np.uint16) * 150
+            gray += arr[..., 2].astype(np.uint16) * 29
+            gray >>= 8
+        else:
+            gray = arr.sum(axis=-1, dtype=np.uint16) // arr.shape[-1]
+        arr = gray.astype(np.uint8)
         mode = "L"
 
-    img = Image.fromarray(arr, mode=mode)
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
+    # frombuffer wraps arr's memory directly (no copy) when it is contiguous
+    arr = np.ascontiguousarray(arr)
+    return Image.frombuffer(mode, (arr.shape[1], arr.shape[0]), arr, "raw", mode, 0, 1)
+
+
+def build_pyramid(img):
+    """
+    Level 0 is the full-resolution image, each further level is a 2x box
+    reduction of the previous one, down to the first level that fits in
+    a single tile.
+    """
+    levels = [img]
+    while max(levels[-1].size) > TILE_SIZE:
+        levels.append(levels[-1].reduce(2))
+    return levels
+
+
+def fit_image(levels, max_size=None):
+    """
+    The image to send as the overview: the smallest pyramid level that still
+    covers max_size, shrunk (keeping aspect ratio) so neither side exceeds it.
+    """
+    img = levels[0]
+    if not max_size:
+        return img
+    for level in levels[1:]:
+        if max(level.size) < max_size:
+            break
+        img = level
+    if max(img.size) > max_size:
+        w, h = img.size
+        f = max_size / max(w, h)
+        img = img.resize((max(1, round(w * f)), max(1, round(h * f))), Image.Resampling.LANCZOS)
+        print(f"Downsampled to {img.size[0]}x{img.size[1]} for display")
+    return img
+
+
+def image_to_bytes(img):
+    buf = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    if max(img.size) <= WEBP_MAX_DIM:
+        # Lossless, fastest effort: smaller than PNG and quicker to encode
+        img.save(buf, format="WEBP", lossless=True, quality=0, method=0)
+        mimetype = "image/webp"
+    else:
+        img.save(buf, format="PNG")
+        mimetype = "image/png"
     buf.seek(0)
-    return buf
+    return buf, mimetype
+
+
+def image_to_rgba_bytes(img, info):
+    """
+    Raw pixels for the browser: a RAW_HEADER_BYTES JSON header
+    {"w", "h", **info} padded with spaces, followed by w*h*4 bytes of RGBA,
+    ready for `new ImageData(...)`. No zlib/WebP work on either side.
+    "w"/"h" are the overview's size; info describes the full image.
+    """
+    img = img.convert("RGBA")
+    w, h = img.size
+    header = orjson.dumps({"w": w, "h": h, **info})
+    if len(header) > RAW_HEADER_BYTES:
+        raise ValueError(f"Raw header too long ({len(header)} bytes): {header!r}")
+    buf = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    buf.write(header.ljust(RAW_HEADER_BYTES))
+    buf.write(img.tobytes())
+    buf.seek(0)
+    return buf, "application/octet-stream"
+
+
+def load_pyramid(data, filename):
+    """
+    Decode an upload and build its display pyramid (see build_pyramid).
+    Returns (levels, info), info being the source dtype and the value range
+    that was mapped to 0..255.
+    """
+    # Rebinding arr at each stage drops the previous stage's buffer as soon as
+    # the next one exists (unless it's a view), so at most two are alive at once
+    arr = load_tif_or_image(data, filename)
+    arr = select_display_array(arr)
+    if arr.dtype == np.uint8:
+        vmin, vmax = 0, 255  # shown as-is
+    else:
+        vmin, vmax = value_range(arr)
+    info = {"dtype": str(arr.dtype), "vmin": float(vmin), "vmax": float(vmax)}
+    arr = normalize_to_uint8(arr, vmin, vmax)
+    return build_pyramid(to_display_image(arr)), info
+
+
+def pyramid_manifest(key, pyramid):
+    """Size, pyramid layout and source info, as sent to the client."""
+    levels, info = pyramid
+    w, h = levels[0].size
+    return {"key": key, "width": w, "height": h, "levels": len(levels),
+            "tile_size": TILE_SIZE, **info}
+
+
+def process_upload(data, filename, max_size=None, fmt="raw"):
+    """
+    Full pipeline for one upload: decode (or fetch from the cache) the
+    pyramid, then encode the overview.
+    Returns (key, (levels, info), buffer, mimetype).
+    """
+    key = upload_key(data)
+    pyramid = cache_get(key)
+    if pyramid is None:
+        pyramid = load_pyramid(data, filename)
+        cache_set(key, pyramid)
+    else:
+        print(f"Cache hit for {filename} ({key})")
+    overview = fit_image(pyramid[0], max_size)
+    if fmt == "raw":
+        buf, mimetype = image_to_rgba_bytes(overview, pyramid_manifest(key, pyramid))
+    else:
+        buf, mimetype = image_to_bytes(overview)
+    return key, pyramid, buf, mimetype
+
+
+# tifffile/libtiff, NumPy, Numba (nogil) and Pillow's encoders release the GIL,
+# so uploads from several panels really run in parallel on these threads
+EXECUTOR = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+
+# ---------- Pyramid cache (keyed by upload content) ----------
+
+# Pyramids are uncompressed (about 1.33x the full-res image), hence a larger
+# budget than the 256 MiB that held encoded overviews; the per-item cap stops
+# one huge image from flushing everything else
+CACHE_MAX_BYTES = 1024 * 1024 * 1024
+CACHE_MAX_ITEM_BYTES = 256 * 1024 * 1024
+
+_cache = OrderedDict()  # key -> ((levels, info), nbytes), oldest first
+_cache_nbytes = 0
+_cache_lock = threading.Lock()
+
+
+def upload_key(data):
+    # Content hash, so re-selecting the same file hits regardless of its name
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def cache_get(key):
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is None:
+            return None
+        _cache.move_to_end(key)
+        return hit[0]
+
+
+def pyramid_nbytes(levels):
+    # Pillow keeps 8-bit multi-band images (RGB included) at 4 bytes per pixel
+    return sum((1 if len(img.getbands()) == 1 else 4) * img.width * img.height
+               for img in levels)
+
+
+def cache_set(key, pyramid):
+    global _cache_nbytes
+    levels, _ = pyramid
+    nbytes = pyramid_nbytes(levels)
+    if nbytes > CACHE_MAX_ITEM_BYTES:
+        return
+    with _cache_lock:
+        if key in _cache:
+            return
+        _cache[key] = (pyramid, nbytes)
+        _cache_nbytes += nbytes
+        while _cache_nbytes > CACHE_MAX_BYTES:
+            _, (_, old) = _cache.popitem(last=False)
+            _cache_nbytes -= old
+
+
+# side -> (key, (levels, info)) of the latest upload to each panel. This keeps
+# those pyramids available for /api/tile even when they're evicted from (or
+# too big for) the cache above; at most len(SIDES) of them.
+PANELS = {}
+
+
+def find_pyramid(key):
+    pyramid = cache_get(key)
+    if pyramid is not None:
+        return pyramid
+    for panel_key, panel_pyramid in list(PANELS.values()):
+        if panel_key == key:
+            return panel_pyramid
+    return None
 
 
 # ---------- Flask routes ----------
@@ -221,8 +537,16 @@ INDEX_HTML = r"""
       br: document.getElementById('canvas_br'),
     };
 
+    // Overview per panel (downsampled to screen size by the server)
     const images = { tl: null, tr: null, bl: null, br: null };
 
+    // Tile pyramid per panel: header fields (key, levels, ...) plus a cache of tile <img>s
+    const pyramids = { tl: null, tr: null, bl: null, br: null };
+    const TILE_CACHE_MAX = 512;  // per panel, oldest dropped first
+
+    const RAW_HEADER_BYTES = 256;  // RAW_HEADER_BYTES on the Python side
+
+    // Full-resolution size; view coordinates are in these pixels
     let imgWidth = null;
     let imgHeight = null;
 
@@ -263,14 +587,54 @@ INDEX_HTML = r"""
       offsetY = (rect.height - imgHeight * scale) / 2;
     }
 
-    function drawOne(ctx, canvas, img) {
+    function getTile(side, p, level, tx, ty) {
+      const key = `${level}/${tx}/${ty}`;
+      let tile = p.tiles.get(key);
+      if (!tile) {
+        tile = new Image();
+        tile.onload = () => { if (pyramids[side] === p) scheduleDraw(); };
+        tile.src = `/api/tile/${p.key}/${key}`;
+        p.tiles.set(key, tile);
+        if (p.tiles.size > TILE_CACHE_MAX) p.tiles.delete(p.tiles.keys().next().value);
+      }
+      return tile.complete && tile.naturalWidth ? tile : null;
+    }
+
+    function drawTiles(ctx, canvas, side) {
+      const p = pyramids[side];
+      if (!p) return;
+
+      // Coarsest level whose pixels are still no bigger than a screen pixel
+      const level = Math.max(0, Math.min(p.levels - 1, Math.floor(Math.log2(1 / scale))));
+      const f = 2 ** level;  // full-res pixels per level pixel
+      if (imgWidth / f <= images[side].width) return;  // overview is already as sharp
+
+      // Visible tile range (tile span in full-res pixels)
+      const span = p.tile_size * f;
+      const x0 = Math.max(0, Math.floor(-offsetX / scale / span));
+      const y0 = Math.max(0, Math.floor(-offsetY / scale / span));
+      const x1 = Math.min(Math.ceil(imgWidth / span), Math.ceil((canvas.width - offsetX) / scale / span));
+      const y1 = Math.min(Math.ceil(imgHeight / span), Math.ceil((canvas.height - offsetY) / scale / span));
+
+      for (let ty = y0; ty < y1; ty++) {
+        for (let tx = x0; tx < x1; tx++) {
+          const tile = getTile(side, p, level, tx, ty);
+          if (tile) ctx.drawImage(tile, tx * span, ty * span, tile.width * f, tile.height * f);
+        }
+      }
+    }
+
+    function drawOne(ctx, canvas, side) {
       ctx.setTransform(1, 0, 0, 1, 0, 0);
       ctx.clearRect(0, 0, canvas.width, canvas.height);
 
+      const img = images[side];
       if (!img) return;
 
+      // Overview stretched over full-res coordinates, sharper tiles on top
       ctx.setTransform(scale, 0, 0, scale, offsetX, offsetY);
-      ctx.drawImage(img, 0, 0);
+      ctx.drawImage(img, 0, 0, imgWidth, imgHeight);
+      drawTiles(ctx, canvas, side);
     }
 
     function draw() {
@@ -279,7 +643,7 @@ INDEX_HTML = r"""
       for (const s of sides) {
         const c = canvases[s];
         const ctx = c.getContext('2d');
-        drawOne(ctx, c, images[s]);
+        drawOne(ctx, c, s);
       }
 
       if (imgWidth && imgHeight) {
@@ -289,9 +653,17 @@ INDEX_HTML = r"""
       }
     }
 
-    function setLoadedImage(img, side) {
-      const w = img.width;
-      const h = img.height;
+    // Tiles arrive in bursts: redraw at most once per frame
+    let drawPending = false;
+    function scheduleDraw() {
+      if (drawPending) return;
+      drawPending = true;
+      requestAnimationFrame(() => { drawPending = false; draw(); });
+    }
+
+    function setLoadedImage(img, meta, side) {
+      const w = meta.width;
+      const h = meta.height;
 
       if (!imgWidth || !imgHeight) {
         imgWidth = w;
@@ -302,6 +674,8 @@ INDEX_HTML = r"""
       }
 
       images[side] = img;
+      pyramids[side] = { ...meta, tiles: new Map() };
+      canvases[side].title = `${meta.dtype}, displayed range ${meta.vmin} – ${meta.vmax}`;
 
       // reset view whenever a new image comes in (same behavior as your old version)
       resetView();
@@ -314,7 +688,10 @@ INDEX_HTML = r"""
 
       setStatus(`Uploading (${side}) ${file.name} ...`);
 
-      const resp = await fetch(`/api/upload/${side}`, {
+      // No point shipping more pixels than the screen can show. Use the screen
+      // (not the canvas) size so every panel asks for the same limit.
+      const maxDim = Math.ceil(window.devicePixelRatio * Math.max(screen.width, screen.height));
+      const resp = await fetch(`/api/upload/${side}?max=${maxDim}`, {
         method: "POST",
         body: formData,
       });
@@ -326,14 +703,20 @@ INDEX_HTML = r"""
         return;
       }
 
-      const blob = await resp.blob();
-      const url = URL.createObjectURL(blob);
-      const img = new Image();
-      img.onload = () => {
-        setLoadedImage(img, side);
-        URL.revokeObjectURL(url);
-      };
-      img.src = url;
+      // Raw RGBA: space-padded JSON header (overview w/h, full-res width/height,
+      // pyramid key/levels/tile_size, dtype/vmin/vmax), then pixels
+      const buf = await resp.arrayBuffer();
+      const meta = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, 0, RAW_HEADER_BYTES)));
+      const w = meta.w;
+      const h = meta.h;
+      const imgData = new ImageData(new Uint8ClampedArray(buf, RAW_HEADER_BYTES, w * h * 4), w, h);
+
+      // drawImage() accepts a canvas just like an <img>
+      const offscreen = document.createElement('canvas');
+      offscreen.width = w;
+      offscreen.height = h;
+      offscreen.getContext('2d').putImageData(imgData, 0, 0);
+      setLoadedImage(offscreen, meta, side);
     }
 
     // Bind file inputs
@@ -358,9 +741,12 @@ INDEX_HTML = r"""
       const zoomFactor = event.deltaY < 0 ? 1.1 : 0.9;
       const newScale = scale * zoomFactor;
 
+      // Only block zooming further past a limit: fitting a huge image can
+      // already start below minScale
       const minScale = 0.05;
       const maxScale = 20;
-      if (newScale < minScale || newScale > maxScale) return;
+      if (zoomFactor < 1 && newScale < minScale) return;
+      if (zoomFactor > 1 && newScale > maxScale) return;
 
       const worldX = (x - offsetX) / scale;
       const worldY = (y - offsetY) / scale;
@@ -429,10 +815,16 @@ def index():
 @app.post("/api/upload/<side>")
 def upload(side):
     """
-    Receive uploaded file, run tiff.imread / Pillow in Python,
-    convert to PNG, return PNG bytes.
-    side can be: tl/tr/bl/br (or any string; we don't persist it server-side).
+    Receive uploaded file, run tiff.imread / Pillow in Python and return
+    the overview image as raw RGBA (see image_to_rgba_bytes), or with
+    ?format=image as lossless WebP (PNG if too large for WebP).
+    side is one of SIDES. The full-resolution pyramid is kept server-side
+    under the upload's content key (sent in the raw header), for
+    /api/manifest/<key> and /api/tile/<key>/...
+    Optional ?max=N limits the longest side of the overview to N pixels.
     """
+    if side not in SIDES:
+        return "Unknown side", 404
     if "file" not in request.files:
         return "No file uploaded", 400
 
@@ -440,22 +832,94 @@ def upload(side):
     if not file_storage.filename:
         return "No filename", 400
 
+    max_size = request.args.get("max", type=int)
+    if "max" in request.args and (max_size is None or max_size <= 0):
+        return "max must be a positive integer", 400
+    fmt = request.args.get("format", "raw")
+    if fmt not in ("raw", "image"):
+        return "format must be raw or image", 400
+
+    data = file_storage.read()
     try:
-        arr = load_tif_or_image(file_storage)
-        arr_disp = select_display_array(arr)
-        png_buf = array_to_png_bytes(arr_disp)
+        fut = EXECUTOR.submit(process_upload, data, file_storage.filename, max_size, fmt)
+        key, pyramid, img_buf, mimetype = fut.result()
     except Exception as e:
         print("Error processing image:", e)
         return f"Error: {e}", 500
+    PANELS[side] = (key, pyramid)
 
     return send_file(
-        png_buf,
-        mimetype="image/png",
+        img_buf,
+        mimetype=mimetype,
         as_attachment=False,
-        download_name="image.png",
+        download_name=DOWNLOAD_NAMES[mimetype],
     )
 
 
+@app.get("/api/manifest/<key>")
+def manifest(key):
+    """Same fields as the raw header, for clients using ?format=image."""
+    pyramid = find_pyramid(key)
+    if pyramid is None:
+        return "Unknown or expired image", 404
+    return Response(orjson.dumps(pyramid_manifest(key, pyramid)), mimetype="application/json")
+
+
+@app.get("/api/tile/<key>/<int:level>/<int:x>/<int:y>")
+def tile(key, level, x, y):
+    """
+    One TILE_SIZE x TILE_SIZE tile (smaller at the right/bottom edges) of
+    pyramid level `level` of the upload with content key `key`, where
+    level 0 is full resolution.
+    """
+    pyramid = find_pyramid(key)
+    if pyramid is None:
+        return "Unknown or expired image", 404
+    levels, _ = pyramid
+    if level >= len(levels):
+        return "No such level", 404
+    img = levels[level]
+    left, top = x * TILE_SIZE, y * TILE_SIZE
+    if left >= img.width or top >= img.height:
+        return "No such tile", 404
+
+    box = (left, top, min(left + TILE_SIZE, img.width), min(top + TILE_SIZE, img.height))
+    tile_buf, mimetype = image_to_bytes(img.crop(box))
+    return send_file(
+        tile_buf,
+        mimetype=mimetype,
+        as_attachment=False,
+        download_name=DOWNLOAD_NAMES[mimetype],
+    )
+
+
+def warm_up():
+    """
+    Pay one-time costs at startup rather than on the first upload:
+    Numba compilation (or loading it from its cache) for the common dtypes,
+    and the tifffile / Pillow WebP code paths.
+    """
+    bio = io.BytesIO()
+    tiff.imwrite(bio, np.arange(64, dtype=np.uint16).reshape(8, 8))
+    levels, info = load_pyramid(bio.getvalue(), "warmup.tif")
+    for buf, _ in (image_to_rgba_bytes(levels[0], info), image_to_bytes(levels[0])):
+        buf.close()
+    normalize_to_uint8(np.arange(16, dtype=np.float64))
+
+
+# At import time, so WSGI servers (waitress, gunicorn workers) get it as well
+warm_up()
+
+
 if __name__ == "__main__":
     # Access at http://127.0.0.1:5000
-    app.run(debug=True)
+    # Panels upload independently, so serve them concurrently. waitress is used
+    # when installed; alternatively run e.g.
+    #   gunicorn -w 4 -k gthread --threads 4 -b 127.0.0.1:5000 app:app
+    try:
+        from waitress import serve
+    except ImportError:
+        print("waitress not installed, falling back to the Flask development server")
+        app.run(debug=True, threaded=True)
+    else:
+        serve(app, host="127.0.0.1", port=5000, threads=8)